@@ -1,14 +1,22 @@
+import asyncio
+import csv
+import json
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 
+import aiohttp
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+
+from moazrovne.http import REQUEST_TIMEOUT, session
+from moazrovne.parse import parse_question
 
 DATA_DIR = "data"
 HTML_DIR = os.path.join(DATA_DIR, "html")
 IMAGE_DIR = os.path.join(DATA_DIR, "images")
 CSV_PATH = os.path.join(DATA_DIR, "moazrovne_dataset.csv")
+CSV_FIELDS = ["question_id", "question", "answer", "comment", "source", "packet", "image", "author"]
+PARSED_CACHE_PATH = os.path.join(DATA_DIR, "parsed_cache.jsonl")
 
 # Use HTTP: HTTPS certificate verification fails on some systems.
 BASE_Q_URL = "http://moazrovne.net/q/"
@@ -16,154 +24,192 @@ BASE_Q_URL = "http://moazrovne.net/q/"
 os.makedirs(HTML_DIR, exist_ok=True)
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
-REQUEST_TIMEOUT = 10
-
-try:
-    if os.path.exists(CSV_PATH) and os.path.getsize(CSV_PATH) > 0:
-        df = pd.read_csv(CSV_PATH, encoding="utf-8")
-        df["question_id"] = pd.to_numeric(df["question_id"], errors="coerce")
-        max_qid = int(df["question_id"].max())
-        print(f"✅ Loaded existing dataset. Last question ID: {max_qid}", flush=True)
-    else:
-        raise ValueError("CSV is empty or missing")
-except Exception as e:
-    print(f"⚠️ Starting fresh: {e}", flush=True)
-    df = pd.DataFrame()
-    max_qid = 0
-
-last_print_time = time.time()
-new_data = []
+# The page loop is network-bound, so pages are fetched concurrently with
+# aiohttp; CONCURRENCY bounds the number of in-flight requests to stay polite,
+# and BATCH_SIZE ids are awaited together so the 404-streak stop rule can still
+# be applied in id order without overshooting far past the last question.
+CONCURRENCY = 10
+BATCH_SIZE = 50
 
 missing_streak = 0
 MAX_MISSING = 40
 BUFFER_ID = 2000
 
-qid = max_qid + 1
 
-while True:
-    if qid % 50 == 0:
-        now = time.time()
-        elapsed = now - last_print_time
-        print(f"⏳ Progress: Scraping questions {qid}... (last 50 took {elapsed:.2f}s)", flush=True)
-        last_print_time = now
+def file_sig(path):
+    """Cheap change signature for a cached HTML file."""
+    return f"{os.path.getsize(path)}:{int(os.path.getmtime(path))}"
+
+
+def load_parsed_cache():
+    """Load previously extracted rows keyed by question_id.
+
+    Each line carries the signature of the HTML file it was parsed from, so
+    a rerun only re-parses pages whose cached file actually changed."""
+    cache = {}
+    if os.path.exists(PARSED_CACHE_PATH):
+        with open(PARSED_CACHE_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                cache[record["question_id"]] = record
+    return cache
+
+
+parsed_cache = load_parsed_cache()
 
+
+async def fetch_html(http, sem, qid):
+    """Return (qid, html_bytes, sig) for one question page, reading the
+    on-disk cache when possible and saving fresh downloads into it. Returns
+    (qid, None, None) when the fetch fails."""
     html_path = os.path.join(HTML_DIR, f"q_{qid}.html")
 
     if os.path.exists(html_path):
-        with open(html_path, "r", encoding="utf-8") as f:
-            html_content = f.read()
-    else:
+        sig = file_sig(html_path)
+        if parsed_cache.get(qid, {}).get("_sig") == sig:
+            return qid, None, sig  # row comes straight from the parse cache
+        with open(html_path, "rb") as f:
+            return qid, f.read(), sig
+
+    async with sem:
         url = BASE_Q_URL + str(qid)
         try:
-            r = requests.get(url, timeout=REQUEST_TIMEOUT)
-            html_content = r.text
-            with open(html_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            time.sleep(0.1)
+            async with http.get(url, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as r:
+                html_content = await r.read()
+            # Politeness sleep only here: cache hits never touch the network.
+            await asyncio.sleep(0.1)
         except Exception as e:
-            print(f"❌ Failed to fetch qid {qid}: {e}", flush=True)
-            qid += 1
-            continue
-
-    soup = BeautifulSoup(html_content, "html.parser")
-
-    error_header = soup.select_one("div.content > h1")
-    if error_header and error_header.get_text(strip=True) == "404":
-        if qid > BUFFER_ID:
-            missing_streak += 1
-            if missing_streak >= MAX_MISSING:
-                print(
-                    f"⛔ Stopped after {MAX_MISSING} consecutive missing questions past ID {BUFFER_ID}.",
-                    flush=True,
-                )
+            print(f"❌ Failed to fetch qid {qid}: {e}")
+            return qid, None, None
+
+    # Raw bytes straight to disk: no decode/encode round-trip.
+    with open(html_path, "wb") as f:
+        f.write(html_content)
+    return qid, html_content, file_sig(html_path)
+
+
+def parse_page(args):
+    """Process-pool worker: parse one (qid, html) pair."""
+    qid, html_content = args
+    return qid, parse_question(qid, html_content, IMAGE_DIR)
+
+
+async def scrape(start_qid):
+    """Fetch pages concurrently in id-ordered batches until the 404-streak
+    stop rule fires; returns the list of new question rows."""
+    global missing_streak
+
+    new_data = []
+    last_print_time = time.time()
+    qid = start_qid
+
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY, keepalive_timeout=30)
+    headers = {"User-Agent": "moazrovne-scraper/1.0"}
+    executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as http:
+        sem = asyncio.Semaphore(CONCURRENCY)
+
+        while True:
+            now = time.time()
+            elapsed = now - last_print_time
+            print(
+                f"⏳ Progress: Scraping questions {qid}... (last {BATCH_SIZE} took {elapsed:.2f}s)",
+                flush=True,
+            )
+            last_print_time = now
+
+            batch = range(qid, qid + BATCH_SIZE)
+            results = await asyncio.gather(*(fetch_html(http, sem, q) for q in batch))
+
+            # Pages are independent, so parsing is farmed out to the process
+            # pool; the streak logic below still walks results in id order.
+            to_parse = [
+                (q, html_content)
+                for q, html_content, sig in results
+                if html_content is not None and parsed_cache.get(q, {}).get("_sig") != sig
+            ]
+            parsed = dict(executor.map(parse_page, to_parse, chunksize=8))
+
+            stop = False
+            for q, html_content, sig in sorted(results, key=lambda t: t[0]):
+                cached = parsed_cache.get(q)
+                if sig is not None and cached is not None and cached.get("_sig") == sig:
+                    row = None if cached.get("_404") else {
+                        k: v for k, v in cached.items() if k not in ("_sig", "_404")
+                    }
+                elif html_content is None:
+                    continue  # fetch failed
+                else:
+                    row = parsed[q]
+                    record = {"question_id": q, "_sig": sig}
+                    if row is None:
+                        record["_404"] = True
+                    else:
+                        record.update(row)
+                    parsed_cache[q] = record
+                    with open(PARSED_CACHE_PATH, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+                if row is None:
+                    if q > BUFFER_ID:
+                        missing_streak += 1
+                        if missing_streak >= MAX_MISSING:
+                            print(
+                                f"⛔ Stopped after {MAX_MISSING} consecutive missing questions past ID {BUFFER_ID}.",
+                                flush=True,
+                            )
+                            stop = True
+                            break
+                    continue
+
+                missing_streak = 0
+                new_data.append(row)
+
+            if stop:
                 break
-        qid += 1
-        continue
-
-    missing_streak = 0
+            qid += BATCH_SIZE
 
-    question_tag = soup.select_one("p.question_question")
-    author_tag = soup.select_one("p.question_top .right")
-    author = author_tag.text.strip("© ").strip() if author_tag else ""
+    executor.shutdown()
+    return new_data
 
-    has_image = 0
-    image_tag = soup.select_one("p.question_question img, a.shadowbox")
 
-    if image_tag:
-        if image_tag.name == "a" and "href" in image_tag.attrs:
-            image_url = image_tag["href"].strip()
-        elif image_tag.name == "img" and "src" in image_tag.attrs:
-            image_url = image_tag["src"].strip()
+def main():
+    try:
+        if os.path.exists(CSV_PATH) and os.path.getsize(CSV_PATH) > 0:
+            # Only the resume point is needed, so skip parsing every column.
+            qids = pd.read_csv(CSV_PATH, usecols=["question_id"], encoding="utf-8")["question_id"]
+            max_qid = int(pd.to_numeric(qids, errors="coerce").max())
+            print(f"✅ Loaded existing dataset. Last question ID: {max_qid}", flush=True)
         else:
-            image_url = ""
+            raise ValueError("CSV is empty or missing")
+    except Exception as e:
+        if os.path.exists(CSV_PATH) and os.path.getsize(CSV_PATH) > 0:
+            # Don't append a from-scratch scrape onto a file we couldn't read.
+            print(f"❌ Existing CSV is unreadable, refusing to append to it: {e}", flush=True)
+            return
+        print(f"⚠️ Starting fresh: {e}", flush=True)
+        max_qid = 0
+
+    with session:
+        new_data = asyncio.run(scrape(max_qid + 1))
+
+    if new_data:
+        # The loop resumes at max_qid + 1 and appends in increasing id order,
+        # so rows can go straight onto the end of the file: no reload,
+        # dedup or resort of the whole dataset.
+        write_header = not os.path.exists(CSV_PATH) or os.path.getsize(CSV_PATH) == 0
+        with open(CSV_PATH, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            if write_header:
+                writer.writerow(CSV_FIELDS)
+            writer.writerows([[row[k] for k in CSV_FIELDS] for row in new_data])
+        print(f"✅ Saved {len(new_data)} new questions.", flush=True)
+    else:
+        print("ℹ️ No new questions found in this run.", flush=True)
 
-        if image_url:
-            image_filename = f"qid_{qid}.jpg"
-            image_path = os.path.join(IMAGE_DIR, image_filename)
 
-            if os.path.exists(image_path):
-                has_image = 1
-            else:
-                try:
-                    img_data = requests.get(image_url, timeout=REQUEST_TIMEOUT).content
-                    with open(image_path, "wb") as f:
-                        f.write(img_data)
-                    has_image = 1
-                    time.sleep(0.1)
-                except Exception as e:
-                    print(f"⚠️ Failed to download image for qid {qid}: {e}", flush=True)
-
-    answer = ""
-    comment = ""
-    source = ""
-    packet = ""
-
-    for span in soup.select("div.answer_body > span.clearfix"):
-        label = span.select_one("span.left")
-        value = span.select_one("span.right_nofloat")
-        if not label or not value:
-            continue
-
-        label_text = label.text.strip()
-        value_text = value.get_text(strip=True)
-
-        if label_text == "პასუხი:":
-            answer = value_text
-        elif label_text == "კომენტარი:":
-            comment = value_text
-        elif label_text == "წყარო:":
-            parts = []
-            for elem in value.contents:
-                if getattr(elem, "name", None) == "a" and "href" in elem.attrs:
-                    parts.append(elem["href"].strip())
-                elif isinstance(elem, str):
-                    parts.append(elem.strip())
-                elif getattr(elem, "name", None) == "li":
-                    parts.append(elem.get_text(strip=True))
-            source = " ".join(filter(None, parts))
-        elif label_text == "პაკეტი:":
-            packet = value_text
-
-    new_data.append(
-        {
-            "question_id": qid,
-            "question": question_tag.get_text(strip=True) if question_tag else "",
-            "answer": answer,
-            "comment": comment,
-            "source": source,
-            "packet": packet,
-            "image": has_image,
-            "author": author,
-        }
-    )
-
-    qid += 1
-
-if new_data:
-    df_new = pd.DataFrame(new_data)
-    df = pd.concat([df, df_new], ignore_index=True)
-    df = df.drop_duplicates(subset="question_id", keep="first").sort_values(by="question_id")
-    df.to_csv(CSV_PATH, index=False, encoding="utf-8", quoting=1)
-    print(f"✅ Saved {len(df_new)} new questions. Total now: {len(df)}", flush=True)
-else:
-    print("ℹ️ No new questions found in this run.", flush=True)
+if __name__ == "__main__":
+    main()
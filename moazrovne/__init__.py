@@ -0,0 +1 @@
+"""Shared scraping library for moazrovne.net: HTTP session and page parsing."""
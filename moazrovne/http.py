@@ -0,0 +1,24 @@
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+
+REQUEST_TIMEOUT = 10
+
+# One pooled session for the whole run: keep-alive reuses the same socket to
+# moazrovne.net instead of paying a TCP handshake per request. The sqlite
+# backend also remembers 200/404 responses across runs, so a rerun after a
+# partial failure doesn't re-GET urls it has already seen this week.
+session = CachedSession(
+    "data/http_cache.sqlite",
+    allowable_codes=(200, 404),
+    expire_after=86400 * 7,
+)
+session.mount(
+    "http://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+session.headers.update({"User-Agent": "moazrovne-scraper/1.0"})
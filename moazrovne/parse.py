@@ -0,0 +1,155 @@
+import os
+import re
+import shutil
+import time
+
+from lxml import html as lhtml
+from lxml.cssselect import CSSSelector
+from lxml.etree import XPath
+
+from moazrovne.http import REQUEST_TIMEOUT, session
+
+# The selectors are authored as CSS and translated/compiled exactly once at
+# import; one compiled XPath union collects every node the extractor needs in
+# a single depth-first pass (document order) instead of five tree walks.
+COMBINED_XPATH = XPath(
+    " | ".join(
+        CSSSelector(css).path
+        for css in (
+            "p.question_question",
+            "p.question_top .right",
+            "p.question_question img",
+            "a.shadowbox",
+            "div.answer_body > span.clearfix",
+            "div.content > h1",
+        )
+    )
+)
+
+# Cheap pre-check for gap-scan pages: a substring scan over the head of the
+# document is orders of magnitude cheaper than building a tree just to find
+# the 404 header. The full-parse check below stays as the fallback.
+PATTERN_404 = re.compile(rb"<h1>\s*404\s*</h1>")
+
+SEL_SPAN_LABEL = CSSSelector("span.left")
+SEL_SPAN_VALUE = CSSSelector("span.right_nofloat")
+
+# Georgian field labels on the answer block, mapped to CSV column names.
+LABEL_TO_KEY = {
+    "პასუხი:": "answer",
+    "კომენტარი:": "comment",
+    "წყარო:": "source",
+    "პაკეტი:": "packet",
+}
+
+
+def _text(node):
+    """All text under node with each text chunk stripped, like bs4's
+    get_text(strip=True)."""
+    return "".join(s.strip() for s in node.itertext())
+
+
+def extract_source(value):
+    """Join the links, text and list items of a წყარო: value span.
+
+    Direct children only; links come first, then loose text, then list items."""
+    hrefs = [a.get("href").strip() for a in value.findall("a") if a.get("href")]
+    texts = [t.strip() for t in value.xpath("text()") if t.strip()]
+    li_texts = [_text(li) for li in value.findall("li")]
+    return " ".join(filter(None, hrefs + texts + li_texts))
+
+
+def parse_question(qid, html_content, image_dir):
+    """Extract one question row from its page HTML.
+
+    Takes the raw page bytes; returns None for a 404 page. Image downloads
+    happen here synchronously (they are rare compared to page fetches)."""
+    if PATTERN_404.search(html_content[:8192]):
+        return None
+
+    try:
+        # Pages don't always declare their charset, so decode explicitly
+        # instead of letting libxml2 guess.
+        root = lhtml.fromstring(html_content.decode("utf-8", errors="replace"))
+    except lhtml.etree.ParserError:
+        # Empty or unparseable body: treat like a missing question.
+        return None
+
+    question_tag = None
+    author_tag = None
+    image_tag = None
+    error_header = None
+    answer_spans = []
+
+    for node in COMBINED_XPATH(root):
+        tag = node.tag
+        cls = f' {node.get("class", "")} '
+        if tag == "h1":
+            error_header = error_header if error_header is not None else node
+        elif tag == "p" and " question_question " in cls:
+            question_tag = question_tag if question_tag is not None else node
+        elif tag == "span" and " clearfix " in cls:
+            answer_spans.append(node)
+        elif (tag == "img" or " shadowbox " in cls) and image_tag is None:
+            image_tag = node
+        elif author_tag is None:
+            author_tag = node  # the .right node under question_top
+
+    if error_header is not None and _text(error_header) == "404":
+        return None
+
+    author = _text(author_tag).strip("© ").strip() if author_tag is not None else ""
+
+    has_image = 0
+    if image_tag is not None:
+        image_url = (image_tag.get("href") or image_tag.get("src") or "").strip()
+
+        if image_url:
+            image_filename = f"qid_{qid}.jpg"
+            image_path = os.path.join(image_dir, image_filename)
+
+            if os.path.exists(image_path):
+                has_image = 1
+            else:
+                try:
+                    # Stream straight to disk instead of buffering the whole
+                    # image in memory, and refuse non-image payloads (error
+                    # pages, redirects) before writing anything.
+                    with session.get(image_url, timeout=REQUEST_TIMEOUT, stream=True) as ir:
+                        content_type = ir.headers.get("Content-Type", "")
+                        if not content_type.startswith("image/"):
+                            raise ValueError(f"unexpected Content-Type {content_type!r}")
+                        ir.raw.decode_content = True  # honor any Content-Encoding
+                        with open(image_path, "wb") as f:
+                            shutil.copyfileobj(ir.raw, f, length=64 * 1024)
+                    has_image = 1
+                    time.sleep(0.1)
+                except Exception as e:
+                    if os.path.exists(image_path):
+                        os.remove(image_path)  # don't leave a partial download
+                    print(f"⚠️ Failed to download image for qid {qid}: {e}")
+
+    fields = {"answer": "", "comment": "", "source": "", "packet": ""}
+
+    for span in answer_spans:
+        label = next(iter(SEL_SPAN_LABEL(span)), None)
+        value = next(iter(SEL_SPAN_VALUE(span)), None)
+        if label is None or value is None:
+            continue
+
+        key = LABEL_TO_KEY.get("".join(label.itertext()).strip())
+        if key is None:
+            continue
+
+        if key == "source":
+            fields[key] = extract_source(value)
+        else:
+            fields[key] = _text(value)
+
+    return {
+        "question_id": qid,
+        "question": _text(question_tag) if question_tag is not None else "",
+        **fields,
+        "image": has_image,
+        "author": author,
+    }
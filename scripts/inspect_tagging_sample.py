@@ -74,63 +74,103 @@ def main():
         print("   Run tag_questions_gpu.py first.", file=sys.stderr)
         sys.exit(1)
 
-    with open(args.input, encoding="utf-8") as f:
-        data = json.load(f)
-
-    tagged = [q for q in data if "primary_genre" in q]
-    untagged = len(data) - len(tagged)
+    # ── Summary mode (needs every record, so load the whole file) ──
+    if args.summary:
+        try:
+            import orjson
+        except ImportError:
+            with open(args.input, encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            # Rust-based parser, 2-5x faster than stdlib on a big tag file.
+            with open(args.input, "rb") as f:
+                data = orjson.loads(f.read())
+
+        tagged = [q for q in data if "primary_genre" in q]
+        untagged = len(data) - len(tagged)
+
+        print(f"📄 {args.input}: {len(data)} questions total, {len(tagged)} tagged, {untagged} untagged.\n")
+        if not tagged:
+            # pd.DataFrame([]) has no columns; mirror the old empty output.
+            print("── Primary genre distribution ──────────────────────────────────")
+            print("\n── All-label appearances (including non-primary) ───────────────")
+            print("\n   Average top-label confidence: 0.000")
+            return
 
-    print(f"📄 {args.input}: {len(data)} questions total, {len(tagged)} tagged, {untagged} untagged.\n")
+        import pandas as pd
 
-    # ── Summary mode ──
-    if args.summary:
-        from collections import Counter
-        primary_counts = Counter(q["primary_genre"] for q in tagged)
-        all_label_counts = Counter(
-            tag["label"]
-            for q in tagged
-            for tag in q.get("genre_tags", [])
-        )
-        avg_score = (
-            sum(q["genre_tags"][0]["score"] for q in tagged if q.get("genre_tags"))
-            / max(len(tagged), 1)
-        )
+        # Vectorized aggregation: one DataFrame pass instead of three
+        # Python loops over the tagged list.
+        df = pd.DataFrame(tagged)
+        primary_counts = df["primary_genre"].value_counts()
+        exploded = df["genre_tags"].explode().dropna()
+        all_label_counts = exploded.str["label"].value_counts()
+        avg_score = df["genre_tags"].str[0].str["score"].sum() / max(len(tagged), 1)
 
         print("── Primary genre distribution ──────────────────────────────────")
-        for label, count in sorted(primary_counts.items(), key=lambda x: -x[1]):
-            bar = "█" * (count * 40 // max(primary_counts.values(), default=1))
+        max_count = primary_counts.max() if len(primary_counts) else 1
+        for label, count in primary_counts.items():
+            bar = "█" * (count * 40 // max_count)
             print(f"  {label:<22} {count:>5}  {bar}")
 
         print("\n── All-label appearances (including non-primary) ───────────────")
-        for label, count in sorted(all_label_counts.items(), key=lambda x: -x[1]):
+        for label, count in all_label_counts.items():
             print(f"  {label:<22} {count:>5}")
 
         print(f"\n   Average top-label confidence: {avg_score:.3f}")
         return
 
-    # ── Build pool ──
-    pool = tagged
-
-    if args.genre:
-        pool = [q for q in pool if q.get("primary_genre") == args.genre]
-        if not pool:
-            print(f"❌ No questions with primary_genre='{args.genre}'.")
-            print(f"   Available genres: {sorted({q['primary_genre'] for q in tagged})}")
-            sys.exit(1)
-
-    if args.uncertain:
-        pool = [
-            q for q in pool
-            if q.get("genre_tags") and q["genre_tags"][0]["score"] < args.threshold
-        ]
-        if not pool:
-            print(f"ℹ️  No questions with top score < {args.threshold}.")
-            return
+    # ── Sample modes: stream the file and reservoir-sample in one pass ──
+    # json.load would materialize the whole corpus just to show --n questions;
+    # ijson keeps one record in memory at a time.
+    import ijson
 
     if args.seed is not None:
         random.seed(args.seed)
 
-    sample = random.sample(pool, min(args.n, len(pool)))
+    sample = []
+    total = n_tagged = genre_matching = matching = 0
+    genres_seen = set()
+
+    with open(args.input, "rb") as f:
+        # use_float: Decimal scores would compare differently against the
+        # float threshold at exact boundaries (e.g. a 0.4 score vs --threshold 0.4)
+        for q in ijson.items(f, "item", use_float=True):
+            total += 1
+            if "primary_genre" not in q:
+                continue
+            n_tagged += 1
+            genres_seen.add(q["primary_genre"])
+
+            if args.genre and q["primary_genre"] != args.genre:
+                continue
+            genre_matching += 1
+
+            if args.uncertain and not (
+                q.get("genre_tags") and q["genre_tags"][0]["score"] < args.threshold
+            ):
+                continue
+
+            # Reservoir sampling: every matching record ends up in the sample
+            # with probability n/matching without holding the pool in memory.
+            matching += 1
+            if len(sample) < args.n:
+                sample.append(q)
+            else:
+                j = random.randint(0, matching - 1)
+                if j < args.n:
+                    sample[j] = q
+
+    print(f"📄 {args.input}: {total} questions total, {n_tagged} tagged, {total - n_tagged} untagged.\n")
+
+    if args.genre and genre_matching == 0:
+        print(f"❌ No questions with primary_genre='{args.genre}'.")
+        print(f"   Available genres: {sorted(genres_seen)}")
+        sys.exit(1)
+
+    if args.uncertain and matching == 0:
+        print(f"ℹ️  No questions with top score < {args.threshold}.")
+        return
 
     # ── Print sample ──
     for i, q in enumerate(sample, 1):
@@ -145,7 +185,7 @@ def main():
             print(f"  C: {trunc(q['comment'], args.full)}")
 
     print_separator()
-    print(f"\n✅ Showed {len(sample)} of {len(pool)} matching questions.")
+    print(f"\n✅ Showed {len(sample)} of {matching} matching questions.")
 
 
 if __name__ == "__main__":